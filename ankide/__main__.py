@@ -2,33 +2,79 @@
 # -*- coding: utf-8 -*-
 
 """Usage:
-    test_doc -h | --help
-    test_doc -V | --version
-    test_doc [-o FILE] <word>
+    ankide -h | --help
+    ankide -V | --version
+    ankide prefetch [options] <list>
+    ankide batch [options] <input>
+    ankide [options] <word>...
 
 Options:
     -o FILE   --output=FILE     Path to .csv file [$HOME/Dropbox/words.csv].
+    -p        --parallel        Request the translation while Wiktionary is fetched.
+    --hedge=SECONDS             Send a second Wiktionary request if the first is slower.
+    -t        --timings         Report per-word latency percentiles.
+    --cache-dir=DIR             Local cache of Wiktionary pages [default: ~/.cache/ankide].
+    --no-cache                  Always fetch pages from Wiktionary.
+    --refresh                   Fetch pages from Wiktionary again and update the cache.
+    -j N      --jobs=N          Concurrent downloads while prefetching [default: 2].
+    --rate=BYTES                Download limit in bytes per second while prefetching [default: 100000].
+    --journal=FILE              Progress journal of a batch job [default: <output>.journal].
+    --retries=N                 Attempts per word before a batch job gives up on it [default: 3].
+    --group=N                   Journal entries flushed to disk together [default: 20].
+    --metrics-file=FILE         Accumulate Prometheus metrics in this textfile.
+    --metrics-port=PORT         Serve Prometheus metrics on localhost while running.
     -h        --help            Show this screen.
     -V        --version         Show program version.
 
 Arguments:
-    <verb>     Verb to translate.
+    <word>     Words to translate.
+    <list>     Frequency list with one word per line to prefetch into the cache.
+    <input>    List with one word per line to add to the output file.
 """
 
+import os
 import sys
 import csv
+import time
 import pathlib
 import configparser
+import concurrent.futures
 import docopt
+import requests
 from microsofttranslator import Translator
-from .wiktionary_parser import parse_word, WordNotFoundError
+from .wiktionary_parser import parse_word, WordNotFoundError, PageBudgetExceededError
+from .hedging import hedged_call, LatencyRecorder, RETRIES
+from .metrics import REGISTRY
+from .cache import WordCache
+from .warm import Throttle, read_word_list, warm
+from .journal import Journal, JournalError
 
 __version__ = 1.2
 
 KEY = pathlib.Path(__file__).parent / "key.ini"
 
+WORDS = REGISTRY.counter("ankide_words_total", "Words looked up by word type.", ["word_type"])
+WORD_SECONDS = REGISTRY.histogram("ankide_word_seconds", "Time to look up a word, prompts excluded.")
+TRANSLATIONS = REGISTRY.counter("ankide_translations_total", "Translations by source.", ["source"])
+TRANSLATION_SECONDS = REGISTRY.histogram(
+    "ankide_translation_seconds",
+    "Time spent in Bing requests; source speculative includes requests whose result was discarded.",
+    ["source"])
+ROWS_WRITTEN = REGISTRY.counter("ankide_rows_written_total", "Rows appended to the output file.")
+WRITE_SECONDS = REGISTRY.histogram("ankide_write_seconds", "Time spent writing rows.")
+
 
 def bing_translator(word):
+    with TRANSLATION_SECONDS.time("bing"):
+        return _bing_translator(word)
+
+
+def speculative_translator(word):
+    with TRANSLATION_SECONDS.time("speculative"):
+        return _bing_translator(word)
+
+
+def _bing_translator(word):
     config = configparser.ConfigParser()
 
     with KEY.open("r") as key:
@@ -41,12 +87,25 @@ def bing_translator(word):
     return translator.translate(word, to_lang="en", from_lang="de")
 
 
-def get_translation(wiktionary_object, word):
+def get_translation(wiktionary_object, word, speculative=None):
+    """Translate word, preferring the page's en translation.
+
+    speculative is a future already translating the word being looked up;
+    it is used instead of a new Bing request even if word is a different
+    form of it, such as the first person of a verb.
+    """
     try:
-        return wiktionary_object.translation()["en"]
+        translation = wiktionary_object.translation()["en"]
     except KeyError:
+        if speculative is not None:
+            TRANSLATIONS.inc("speculative")
+            return speculative.result()
+        TRANSLATIONS.inc("bing")
         return bing_translator(word)
 
+    TRANSLATIONS.inc("wiktionary")
+    return translation
+
 
 def prompt(string, valid_responses):
     answer = input(string).strip().lower()
@@ -58,13 +117,15 @@ def prompt(string, valid_responses):
 
 
 def write_file(file, data_list):
-    with file.open("a", encoding="utf-8", newline="") as csvfile:
+    with WRITE_SECONDS.time(), file.open("a", encoding="utf-8", newline="") as csvfile:
         writer = csv.writer(csvfile, dialect=csv.excel_tab)
         writer.writerow(data_list)
 
+    ROWS_WRITTEN.inc()
+
 
 def parse_args():
-    args = docopt.docopt(__doc__, version=__version__, options_first=True)
+    args = docopt.docopt(__doc__, version=__version__)
 
     options = {}
 
@@ -73,77 +134,112 @@ def parse_args():
     else:
         options["output"] = pathlib.Path(args["-o"]).expanduser().absolute()
 
-    options["word"] = args["<word>"]
+    options["prefetch"] = args["prefetch"]
+    options["list"] = pathlib.Path(args["<list>"]).expanduser().absolute() if args["<list>"] else None
+    options["batch"] = args["batch"]
+    options["input"] = pathlib.Path(args["<input>"]).expanduser().absolute() if args["<input>"] else None
+    options["words"] = args["<word>"]
+    options["parallel"] = args["-p"]
+    options["hedge"] = float(args["--hedge"]) if args["--hedge"] else None
+    options["timings"] = args["-t"]
+    options["cache"] = None if args["--no-cache"] else WordCache(args["--cache-dir"], refresh=args["--refresh"])
+    options["jobs"] = int(args["-j"])
+    options["rate"] = float(args["--rate"])
+
+    if args["--journal"] == "<output>.journal":
+        options["journal"] = options["output"].with_name(options["output"].name + ".journal")
+    else:
+        options["journal"] = pathlib.Path(args["--journal"]).expanduser().absolute()
+
+    options["retries"] = int(args["--retries"])
+    options["group"] = int(args["--group"])
+
+    if args["--metrics-file"]:
+        options["metrics file"] = pathlib.Path(args["--metrics-file"]).expanduser().absolute()
+    else:
+        options["metrics file"] = None
+
+    options["metrics port"] = int(args["--metrics-port"]) if args["--metrics-port"] else None
 
     return options
 
 
-def main():
-    options = parse_args()
+def fetch(word, options, executor):
+    return hedged_call(
+        executor, parse_word, word, options["cache"],
+        delay=options["hedge"],
+        retry_on=(requests.RequestException,)
+    )
 
-    print("Looking for word: {}".format(options["word"]), flush=True)
 
-    chosen_word = options["word"]
+def lookup(word, options, executor, speculative, progress=lambda word, state, **fields: None):
+    """Look word up and build its row for the output file.
+
+    Returns a (found, data) tuple; data is None if there is nothing to add.
+    Every step reached is reported to progress as in Journal.record.
+    """
+    print("Looking for word: {}".format(word), flush=True)
+
+    chosen_word = word
 
     try:
-        wiktionary = parse_word(chosen_word)
+        wiktionary = fetch(chosen_word, options, executor)
     except WordNotFoundError:
-        translation = bing_translator(options["word"])
+        WORDS.inc("not_found")
+        progress(word, "fetched", found=False)
+
+        if word in speculative:
+            TRANSLATIONS.inc("speculative")
+            translation = speculative[word].result()
+        else:
+            TRANSLATIONS.inc("bing")
+            translation = bing_translator(word)
         print("Could not find word {}! It could mean >>{}<<.".format(
             chosen_word,
             translation
         ), flush=True, file=sys.stderr)
+        progress(word, "translated")
 
-        print(flush=True)
-        answer = prompt("Add word to file? [Y/n] ", "yn")
-
-        if answer == "y" or not answer:
-            write_file(
-                options["output"],
-                [
-                    chosen_word,
-                    translation,
-                    None, None, None, None, None, None, None,
-                ]
-            )
-        raise SystemExit(1)
+        return False, [
+            chosen_word,
+            translation,
+            None, None, None, None, None, None, None,
+        ]
 
     if wiktionary.is_conjugated():
         new_word = wiktionary.basic_form()
         print("Word {} is in conjugated form, trying {} instead...".format(chosen_word, new_word), flush=True)
 
-        try:
-            wiktionary = parse_word(new_word)
-            chosen_word = new_word
-        except WordNotFoundError:
-            print("Could not find word {}! Please try again!".format(new_word), flush=True, file=sys.stderr)
-            raise SystemExit(1)
-
     elif wiktionary.is_a_declension():
         new_word = wiktionary.basic_form()
-        print("Word {} is a declension, trying {} instead...".format(options["word"], new_word), flush=True)
-
-        try:
-            wiktionary = parse_word(new_word)
-            chosen_word = new_word
-        except WordNotFoundError:
-            print("Could not find word {}! Please try again!".format(new_word), flush=True, file=sys.stderr)
-            raise SystemExit(1)
+        print("Word {} is a declension, trying {} instead...".format(word, new_word), flush=True)
 
     elif wiktionary.is_partizip_ii():
         new_word = wiktionary.basic_form()
-        print("Word {} is in partizip II form, trying {} instead...".format(options["word"], new_word), flush=True)
+        print("Word {} is in partizip II form, trying {} instead...".format(word, new_word), flush=True)
+
+    else:
+        new_word = None
+
+    if new_word is not None:
+        if options["parallel"] and new_word not in speculative:
+            speculative[new_word] = executor.submit(speculative_translator, new_word)
 
         try:
-            wiktionary = parse_word(new_word)
+            wiktionary = fetch(new_word, options, executor)
             chosen_word = new_word
         except WordNotFoundError:
             print("Could not find word {}! Please try again!".format(new_word), flush=True, file=sys.stderr)
-            raise SystemExit(1)
+            WORDS.inc("not_found")
+            progress(word, "failed", reason="basic form {} not found".format(new_word), permanent=True)
+            return False, None
 
-    print("Word type: {}".format(wiktionary.word_type()), flush=True)
+    progress(word, "fetched")
+
+    WORDS.inc(wiktionary.word_type() or "unknown")
 
-    data = []
+    print("Word type: {}".format(wiktionary.word_type()), flush=True)
+    progress(word, "parsed")
 
     if wiktionary.word_type() == "Substantiv":
         overview = wiktionary.overview()
@@ -157,7 +253,7 @@ def main():
 
         print("Basic form: {} {}".format(genus, overview["Nominativ Singular"]))
 
-        translation = get_translation(wiktionary, overview["Nominativ Singular"])
+        translation = get_translation(wiktionary, overview["Nominativ Singular"], speculative.get(chosen_word))
         print("Translation: {}".format(translation), flush=True)
 
         print("Plural: {}".format(overview["Nominativ Plural"]), flush=True)
@@ -183,7 +279,7 @@ def main():
     elif wiktionary.word_type() == "Verb":
         overview = wiktionary.overview()
 
-        translation = get_translation(wiktionary, overview["Präsens_ich"])
+        translation = get_translation(wiktionary, overview["Präsens_ich"], speculative.get(chosen_word))
         print("Translation: {}".format(translation), flush=True)
 
         print("Präsens (ich): {}".format(overview["Präsens_ich"]), flush=True)
@@ -213,7 +309,7 @@ def main():
     elif wiktionary.word_type() == "Adjektiv":
         overview = wiktionary.overview()
 
-        translation = get_translation(wiktionary, chosen_word)
+        translation = get_translation(wiktionary, chosen_word, speculative.get(chosen_word))
         print("Translation: {}".format(translation), flush=True)
 
         print("Komparativ: {}".format(overview.get("Komparativ", None)), flush=True)
@@ -235,7 +331,7 @@ def main():
         ]
 
     elif wiktionary.word_type() == "Adverb":
-        translation = get_translation(wiktionary, chosen_word)
+        translation = get_translation(wiktionary, chosen_word, speculative.get(chosen_word))
         print("Translation: {}".format(translation), flush=True)
 
         example = wiktionary.meanings().get(1, None)
@@ -263,7 +359,7 @@ def main():
         ]
 
     elif wiktionary.word_type() == "Pronominaladverb":
-        translation = get_translation(wiktionary, chosen_word)
+        translation = get_translation(wiktionary, chosen_word, speculative.get(chosen_word))
         print("Translation: {}".format(translation), flush=True)
 
         example = wiktionary.meanings().get(1, None)
@@ -291,7 +387,7 @@ def main():
         ]
 
     elif wiktionary.word_type() == "Konjunktion":
-        translation = get_translation(wiktionary, chosen_word)
+        translation = get_translation(wiktionary, chosen_word, speculative.get(chosen_word))
         print("Translation: {}".format(translation), flush=True)
 
         example = wiktionary.meanings().get(1, None)
@@ -319,7 +415,7 @@ def main():
         ]
 
     elif wiktionary.word_type() == "Indefinitpronomen":
-        translation = get_translation(wiktionary, chosen_word)
+        translation = get_translation(wiktionary, chosen_word, speculative.get(chosen_word))
         print("Translation: {}".format(translation), flush=True)
 
         example = wiktionary.meanings().get(1, None)
@@ -347,7 +443,7 @@ def main():
         ]
 
     elif wiktionary.word_type() == "Subjunktion":
-        translation = get_translation(wiktionary, chosen_word)
+        translation = get_translation(wiktionary, chosen_word, speculative.get(chosen_word))
         print("Translation: {}".format(translation), flush=True)
 
         example = wiktionary.meanings().get(1, None)
@@ -376,13 +472,167 @@ def main():
 
     else:
         print("No additional information is available!", flush=True)
+        progress(word, "failed", reason="unsupported word type {}".format(wiktionary.word_type()), permanent=True)
+        return False, None
+
+    progress(word, "translated")
+
+    return True, data
+
+
+def main():
+    options = parse_args()
+
+    if options["metrics port"] is not None:
+        REGISTRY.serve(options["metrics port"])
+
+    try:
+        if options["prefetch"]:
+            run_prefetch(options)
+        elif options["batch"]:
+            run_batch(options)
+        else:
+            run(options)
+    finally:
+        if options["metrics file"] is not None:
+            REGISTRY.add_to_textfile(options["metrics file"])
+
+
+def timed_lookup(word, options, executor, timings, **kwargs):
+    start = time.perf_counter()
+
+    speculative = {}
+    if options["parallel"]:
+        speculative[word] = executor.submit(speculative_translator, word)
+
+    try:
+        return lookup(word, options, executor, speculative, **kwargs)
+    finally:
+        for future in speculative.values():
+            future.cancel()
+
+        elapsed = time.perf_counter() - start
+        timings.record(elapsed)
+        WORD_SECONDS.observe(elapsed)
+
+
+def run(options):
+    timings = LatencyRecorder()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+    failed = False
+
+    for word in options["words"]:
+        try:
+            found, data = timed_lookup(word, options, executor, timings)
+        except PageBudgetExceededError as error:
+            print("Could not parse the page of {}: {}".format(word, error), flush=True, file=sys.stderr)
+            failed = True
+            continue
+
+        if data is not None:
+            print(flush=True)
+            answer = prompt("Add word to file? [Y/n] ", "yn")
+
+            if answer == "y" or not answer:
+                write_file(options["output"], data)
+
+        if not found:
+            failed = True
+
+    executor.shutdown(wait=False)
+
+    if options["timings"]:
+        print("Latency per word: {}".format(timings.report()), flush=True)
+
+    if failed:
+        raise SystemExit(1)
+
+
+def run_batch(options):
+    words = read_word_list(options["input"])
+    timings = LatencyRecorder()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+    counts = {"written": 0, "done before": 0, "failed": 0}
+
+    print("Processing {} words...".format(len(words)), flush=True)
+
+    journal = Journal(options["journal"], options["output"], group_size=options["group"])
+
+    try:
+        journal.open()
+    except JournalError as error:
+        print("Cannot resume batch job: {}".format(error), flush=True, file=sys.stderr)
         raise SystemExit(1)
 
-    print(flush=True)
-    answer = prompt("Add word to file? [Y/n] ", "yn")
+    try:
+        for word in words:
+            if journal.state(word) == "written":
+                counts["done before"] += 1
+                continue
+
+            if journal.state(word) == "failed":
+                failures = journal.failures(word)
+
+                if failures[-1].get("permanent") or len(failures) >= options["retries"]:
+                    counts["failed"] += 1
+                    continue
+
+                RETRIES.inc("batch")
+
+            try:
+                found, data = timed_lookup(word, options, executor, timings, progress=journal.record)
+            except Exception as error:
+                print("Could not process word {}: {!r}".format(word, error), flush=True, file=sys.stderr)
+                journal.record(word, "failed", reason=repr(error),
+                               permanent=isinstance(error, PageBudgetExceededError))
+                counts["failed"] += 1
+                continue
+
+            if data is None:
+                counts["failed"] += 1
+                continue
+
+            with WRITE_SECONDS.time():
+                journal.write_row(word, data)
+            ROWS_WRITTEN.inc()
+            counts["written"] += 1
+    finally:
+        journal.close()
+
+    executor.shutdown(wait=False)
+
+    print("Done: {}".format(", ".join("{} {}".format(count, status) for status, count in counts.items())),
+          flush=True)
+
+    if options["timings"]:
+        print("Latency per word: {}".format(timings.report()), flush=True)
 
-    if answer == "y" or not answer:
-        write_file(options["output"], data)
+    if counts["failed"]:
+        raise SystemExit(1)
+
+
+def run_prefetch(options):
+    if options["cache"] is None:
+        print("Nothing to prefetch without a cache!", flush=True, file=sys.stderr)
+        raise SystemExit(1)
+
+    # stay out of the way of interactive lookups
+    if hasattr(os, "nice"):
+        os.nice(10)
+
+    words = read_word_list(options["list"])
+    print("Prefetching {} words...".format(len(words)), flush=True)
+
+    def report(word, status):
+        print("{}: {}".format(word, status), flush=True)
+
+    counts = warm(words, options["cache"], options["jobs"], Throttle(options["rate"]), report)
+
+    print("Done: {}".format(", ".join("{} {}".format(count, status) for status, count in sorted(counts.items()))),
+          flush=True)
+
+    if counts.get("failed"):
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import os
+import pickle
+import hashlib
+import pathlib
+import tempfile
+import time
+import attr
+from .metrics import REGISTRY
+
+LOOKUPS = REGISTRY.counter("ankide_cache_lookups_total", "Local cache lookups by result.", ["result"])
+
+# seconds before a stored page, or the absence of one, is fetched again
+TTL = 30 * 24 * 3600
+NOT_FOUND_TTL = 24 * 3600
+
+
+@attr.s
+class WordCache:
+    """Wiktionary markup and parsed word data stored on disk, one file per word.
+
+    Words without a Wiktionary page are stored with markup None. Entries
+    older than ttl (not_found_ttl for missing pages) are treated as absent,
+    as is everything when refresh is set; put then replaces them.
+    """
+    directory = attr.ib(converter=lambda path: pathlib.Path(path).expanduser())
+    refresh = attr.ib(default=False)
+    ttl = attr.ib(default=TTL)
+    not_found_ttl = attr.ib(default=NOT_FOUND_TTL)
+
+    def _path(self, word):
+        # hashed so words differing only in case stay apart on case-insensitive file systems
+        return self.directory / "{}.pickle".format(hashlib.sha1(word.encode("utf-8")).hexdigest())
+
+    def _load(self, word):
+        """The stored entry for word, or None if there is none or it has expired."""
+        if self.refresh:
+            return None
+
+        try:
+            with self._path(word).open("rb") as file:
+                entry = pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+        ttl = self.not_found_ttl if entry["markup"] is None else self.ttl
+        if time.time() - entry.get("time", 0) > ttl:
+            return None
+
+        return entry
+
+    def __contains__(self, word):
+        return self._load(word) is not None
+
+    def get(self, word):
+        """Return the (markup, word_data) stored for word; raise KeyError if there is none."""
+        entry = self._load(word)
+
+        if entry is None:
+            LOOKUPS.inc("miss")
+            raise KeyError(word)
+
+        LOOKUPS.inc("hit")
+        return entry["markup"], entry["word_data"]
+
+    def put(self, word, markup, word_data=None):
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # write to a temporary file first so readers never see a partial entry
+        descriptor, temporary = tempfile.mkstemp(dir=str(self.directory), suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                pickle.dump({"word": word, "markup": markup, "word_data": word_data or {}, "time": time.time()}, file)
+            os.replace(temporary, str(self._path(word)))
+        except BaseException:
+            os.unlink(temporary)
+            raise
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import math
+import concurrent.futures
+import attr
+from .metrics import REGISTRY
+
+RETRIES = REGISTRY.counter("ankide_retries_total", "Repeated requests by reason.", ["reason"])
+
+
+def hedged_call(executor, func, *args, delay=None, retry_on=()):
+    """Call func(*args) on executor, hedging stragglers with a second request.
+
+    If the first call has not finished after delay seconds an identical
+    second call is submitted and whichever finishes first wins; the loser
+    is cancelled if it has not started yet and otherwise discarded.
+    A call failing with one of the retry_on exceptions only wins if the
+    other one fails as well.
+    """
+    first = executor.submit(func, *args)
+
+    if delay is None:
+        return first.result()
+
+    try:
+        return first.result(timeout=delay)
+    except concurrent.futures.TimeoutError:
+        pass
+
+    RETRIES.inc("hedge")
+    pending = {first, executor.submit(func, *args)}
+    failed = None
+
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+        for future in done:
+            if isinstance(future.exception(), retry_on):
+                failed = failed or future
+                continue
+
+            for loser in pending:
+                loser.cancel()
+
+            return future.result()
+
+    return failed.result()
+
+
+@attr.s
+class LatencyRecorder:
+    _samples = attr.ib(init=False, default=attr.Factory(list))
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+
+    def percentile(self, percent):
+        """Nearest-rank percentile of the recorded samples, in seconds."""
+        if not self._samples:
+            return None
+
+        ordered = sorted(self._samples)
+        rank = max(1, math.ceil(percent / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+    def report(self):
+        if not self._samples:
+            return "no words timed"
+
+        return "n={} p50={:.0f}ms p90={:.0f}ms p99={:.0f}ms max={:.0f}ms".format(
+            len(self._samples),
+            *(self.percentile(percent) * 1000 for percent in (50, 90, 99, 100))
+        )
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import csv
+import json
+import attr
+
+
+def _format_row(data_list):
+    row = io.StringIO()
+    csv.writer(row, dialect=csv.excel_tab).writerow(data_list)
+    return row.getvalue().encode("utf-8")
+
+
+class JournalError(Exception):
+    pass
+
+
+def _fsync(file):
+    file.flush()
+    os.fsync(file.fileno())
+
+
+@attr.s
+class Journal:
+    """Append-only record of the state of every word in a batch job.
+
+    Each line is a JSON object with the word and its state: fetched,
+    parsed, translated, writing, written or failed (with a reason).
+    Entries are synced to disk in groups. Rows are appended to the output
+    file through write_row, which journals the row before writing it, so
+    a write interrupted by a crash can be completed or cut off when the
+    journal is opened again. Rows others appended to the output file are
+    left alone.
+    """
+    path = attr.ib()
+    output = attr.ib()
+    group_size = attr.ib(default=20)
+    _states = attr.ib(init=False, default=attr.Factory(dict))
+    _failures = attr.ib(init=False, default=attr.Factory(dict))
+    _file = attr.ib(init=False, default=None)
+    _output_file = attr.ib(init=False, default=None)
+    _unflushed = attr.ib(init=False, default=0)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _replay(self):
+        """Read the existing journal.
+
+        Returns the output size after the last row written, the writing
+        entry of an unfinished row if any, and the size of the intact
+        part of the journal.
+        """
+        committed = pending = None
+        intact = 0
+
+        try:
+            with self.path.open("rb") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line.decode("utf-8"))
+                    except ValueError:
+                        break
+                    if not line.endswith(b"\n"):
+                        break
+                    intact += len(line)
+
+                    if entry["state"] == "start":
+                        # a run only starts once the previous unfinished row is dealt with
+                        committed = entry["size"]
+                        pending = None
+                        continue
+
+                    self._states[entry["word"]] = entry["state"]
+
+                    if entry["state"] == "writing":
+                        pending = entry
+                    elif entry["state"] == "written":
+                        committed = entry["end"]
+                        pending = None
+                    elif entry["state"] == "failed":
+                        self._failures.setdefault(entry["word"], []).append(entry)
+        except FileNotFoundError:
+            pass
+
+        return committed, pending, intact
+
+    def _recover(self, pending, size):
+        """Complete or cut off the row being written when the last run was interrupted."""
+        offset = pending["offset"]
+        row = pending["row"].encode("utf-8")
+
+        if size >= offset:
+            with self.output.open("rb") as file:
+                file.seek(offset)
+                written = file.read(len(row))
+
+            if written == row:
+                # only the entry saying the row was written got lost
+                self.record(pending["word"], "written", end=offset + len(row))
+                return
+
+            if size == offset + len(written) and row.startswith(written):
+                # truncating does not move the file position that later offsets are taken from
+                self._output_file.truncate(offset)
+                self._output_file.seek(offset)
+                self.record(pending["word"], "failed", reason="cut off")
+                return
+
+        raise JournalError("{} was changed after a write interrupted at byte {}; "
+                           "check it and remove {} to start over".format(self.output, offset, self.path))
+
+    def open(self):
+        committed, pending, intact = self._replay()
+
+        with self.path.open("ab") as file:
+            file.truncate(intact)
+
+        self._output_file = self.output.open("ab")
+        self._file = self.path.open("ab")
+        size = self._output_file.tell()
+
+        try:
+            if committed is not None and size < committed:
+                raise JournalError("{} is shorter than the {} bytes recorded in {}; "
+                                   "remove it to start over".format(self.output, committed, self.path))
+
+            if pending is not None:
+                self._recover(pending, size)
+        except JournalError:
+            self._file.close()
+            self._output_file.close()
+            self._file = self._output_file = None
+            raise
+
+        self._append({"state": "start", "size": self._output_file.tell()})
+        self.commit()
+
+    def close(self):
+        if self._file is None:
+            return
+
+        self.commit()
+        self._file.close()
+        self._output_file.close()
+        self._file = self._output_file = None
+
+    def state(self, word):
+        return self._states.get(word)
+
+    def failures(self, word):
+        """The failed entries recorded for word, oldest first."""
+        return self._failures.get(word, [])
+
+    def _append(self, entry):
+        self._file.write(json.dumps(entry, ensure_ascii=False).encode("utf-8") + b"\n")
+        self._unflushed += 1
+
+    def record(self, word, state, **fields):
+        entry = {"word": word, "state": state}
+        entry.update(fields)
+        self._append(entry)
+
+        self._states[word] = state
+        if state == "failed":
+            self._failures.setdefault(word, []).append(entry)
+
+        if self._unflushed >= self.group_size:
+            self.commit()
+
+    def write_row(self, word, data_list):
+        row = _format_row(data_list)
+        offset = self._output_file.tell()
+
+        # the intent has to reach the OS before the row, and the row before the entry saying it was written
+        self.record(word, "writing", offset=offset, row=row.decode("utf-8"))
+        self._file.flush()
+        self._output_file.write(row)
+        self._output_file.flush()
+        self.record(word, "written", end=offset + len(row))
+
+    def commit(self):
+        # rows must be on disk before the entries saying they were written
+        _fsync(self._output_file)
+        _fsync(self._file)
+        self._unflushed = 0
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import time
+import bisect
+import threading
+import contextlib
+import http.server
+import attr
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+SAMPLE_PATTERN = re.compile(r"^([a-zA-Z_:][\w:]*)(?:\{(.*)\})?\s+(\S+)$")
+LABEL_PATTERN = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def _unescape(value):
+    return re.sub(r"\\(.)", lambda match: "\n" if match.group(1) == "n" else match.group(1), value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = ['{}="{}"'.format(name, _escape(value)) for name, value in list(zip(names, values)) + list(extra)]
+    return "{{{}}}".format(",".join(pairs)) if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+@attr.s
+class Counter:
+    name = attr.ib()
+    documentation = attr.ib()
+    labelnames = attr.ib(converter=tuple, default=())
+    _values = attr.ib(init=False, default=attr.Factory(dict))
+    _lock = attr.ib(init=False, default=attr.Factory(threading.Lock), repr=False)
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def _exposition(self):
+        yield "# HELP {} {}".format(self.name, self.documentation)
+        yield "# TYPE {} counter".format(self.name)
+
+        with self._lock:
+            values = sorted(self._values.items())
+
+        for labelvalues, value in values:
+            yield "{}{} {}".format(self.name, _format_labels(self.labelnames, labelvalues), _format_value(value))
+
+    def _load(self, name, labels, value):
+        if name == self.name:
+            self._values[tuple(labels.get(label, "") for label in self.labelnames)] = value
+
+    def _add(self, other):
+        with other._lock:
+            values = list(other._values.items())
+
+        for labelvalues, value in values:
+            self.inc(*labelvalues, amount=value)
+
+
+@attr.s
+class Histogram:
+    name = attr.ib()
+    documentation = attr.ib()
+    labelnames = attr.ib(converter=tuple, default=())
+    buckets = attr.ib(converter=tuple, default=DEFAULT_BUCKETS)
+    # labelvalues -> [count per bucket..., count above the last bucket, sum]
+    _values = attr.ib(init=False, default=attr.Factory(dict))
+    _lock = attr.ib(init=False, default=attr.Factory(threading.Lock), repr=False)
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            try:
+                counts = self._values[labelvalues]
+            except KeyError:
+                counts = self._values[labelvalues] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def count(self, *labelvalues):
+        return sum(self._values.get(labelvalues, [0, 0])[:-1])
+
+    def _exposition(self):
+        yield "# HELP {} {}".format(self.name, self.documentation)
+        yield "# TYPE {} histogram".format(self.name)
+
+        with self._lock:
+            values = sorted((labelvalues, list(counts)) for labelvalues, counts in self._values.items())
+
+        for labelvalues, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "{}_bucket{} {}".format(
+                    self.name,
+                    _format_labels(self.labelnames, labelvalues, [("le", _format_value(bound))]),
+                    cumulative
+                )
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield "{}_sum{} {}".format(self.name, labels, _format_value(counts[-1]))
+            yield "{}_count{} {}".format(self.name, labels, cumulative)
+
+    def _load(self, name, labels, value):
+        labelvalues = tuple(labels.get(label, "") for label in self.labelnames)
+        counts = self._values.setdefault(labelvalues, [0] * (len(self.buckets) + 2))
+
+        if name == self.name + "_sum":
+            counts[-1] = value
+        elif name == self.name + "_bucket":
+            bound = float(labels.get("le", "+Inf"))
+            bounds = self.buckets + (float("inf"),)
+            if bound in bounds:
+                # buckets are exported cumulatively and loaded in ascending order
+                index = bounds.index(bound)
+                counts[index] = int(value) - sum(counts[:index])
+
+    def _add(self, other):
+        with other._lock:
+            values = [(labelvalues, list(counts)) for labelvalues, counts in other._values.items()]
+
+        with self._lock:
+            for labelvalues, counts in values:
+                mine = self._values.setdefault(labelvalues, [0] * (len(self.buckets) + 2))
+                for index, count in enumerate(counts):
+                    mine[index] += count
+
+
+@attr.s
+class Registry:
+    _metrics = attr.ib(init=False, default=attr.Factory(dict))
+
+    def _register(self, metric):
+        try:
+            existing = self._metrics[metric.name]
+        except KeyError:
+            self._metrics[metric.name] = metric
+            return metric
+
+        if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+            raise ValueError("Metric registered twice with different types or labels", metric.name)
+        return existing
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def exposition(self):
+        """All metrics in the Prometheus text format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric._exposition())
+        return "\n".join(lines) + "\n"
+
+    def load(self, text):
+        """Restore values from an earlier exposition so counts keep accumulating."""
+        for line in text.splitlines():
+            match = SAMPLE_PATTERN.match(line.strip())
+            if not match:
+                continue
+
+            name, labels, value = match.groups()
+            labels = {label: _unescape(label_value) for label, label_value in LABEL_PATTERN.findall(labels or "")}
+
+            for suffix in ("", "_bucket", "_sum", "_count"):
+                if suffix and not name.endswith(suffix):
+                    continue
+                metric = self._metrics.get(name[:len(name) - len(suffix)])
+                if metric is not None:
+                    metric._load(name, labels, float(value))
+                    break
+
+    def read_textfile(self, path):
+        try:
+            with path.open("r", encoding="utf-8") as file:
+                self.load(file.read())
+        except FileNotFoundError:
+            pass
+
+    def write_textfile(self, path):
+        # write to a temporary file first so the collector never sees a partial file
+        temporary = path.with_name(path.name + ".{}.tmp".format(os.getpid()))
+        with temporary.open("w", encoding="utf-8") as file:
+            file.write(self.exposition())
+        os.replace(str(temporary), str(path))
+
+    def add_to_textfile(self, path):
+        """Add this process's values to those already in the textfile.
+
+        Several processes may share one textfile: each adds only what it
+        counted itself, under a lock held while the file is read and
+        rewritten, so no increments are lost and counters never go back.
+        """
+        with path.with_name(path.name + ".lock").open("a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+
+            # same metrics, but starting from what is in the file
+            merged = Registry()
+            for metric in self._metrics.values():
+                merged._register(attr.evolve(metric))
+
+            merged.read_textfile(path)
+            for name, metric in self._metrics.items():
+                merged._metrics[name]._add(metric)
+            merged.write_textfile(path)
+
+    def serve(self, port, address="127.0.0.1"):
+        """Serve the metrics over HTTP from a daemon thread."""
+        registry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.exposition().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((address, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+REGISTRY = Registry()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+import concurrent.futures
+import attr
+from .wiktionary_parser import WiktionaryParser, WordNotFoundError, fetch_markup
+
+
+@attr.s
+class Throttle:
+    """Spaces out downloads so they average at most rate bytes per second."""
+    rate = attr.ib()
+    _next = attr.ib(init=False, default=0.0)
+    _lock = attr.ib(init=False, default=attr.Factory(threading.Lock), repr=False)
+
+    def consume(self, amount):
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._next - now)
+            self._next = max(now, self._next) + amount / self.rate
+
+        time.sleep(delay)
+
+
+def read_word_list(file):
+    """Words from the first column of a frequency list, without duplicates."""
+    words = []
+    seen = set()
+
+    with file.open("r", encoding="utf-8") as word_list:
+        for line in word_list:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            word = line.split()[0]
+            if word not in seen:
+                seen.add(word)
+                words.append(word)
+
+    return words
+
+
+def warm_word(word, cache, throttle):
+    """Make sure word is fetched and fully parsed in cache.
+
+    Returns a (status, lemma) tuple; lemma is the basic form of an
+    inflected word and None otherwise.
+    """
+    try:
+        markup, word_data = cache.get(word)
+        status = "cached"
+    except KeyError:
+        try:
+            markup = fetch_markup(word)
+        except WordNotFoundError:
+            cache.put(word, None)
+            return "not found", None
+
+        throttle.consume(len(markup.encode("utf-8")))
+        word_data = {}
+        status = "fetched"
+
+    if markup is None:
+        return "not found", None
+
+    wiktionary = WiktionaryParser(markup, word_data)
+
+    if not word_data:
+        cache.put(word, markup, wiktionary.parse_all())
+
+    if wiktionary.is_conjugated() or wiktionary.is_a_declension() or wiktionary.is_partizip_ii():
+        return status, wiktionary.basic_form()
+
+    return status, None
+
+
+def warm(words, cache, jobs, throttle, report=lambda word, status: None):
+    """Prefetch words and the lemmas of their inflected forms into cache.
+
+    Words already cached are not downloaded again, so an interrupted run
+    can simply be restarted. Returns the number of words per status.
+    """
+    counts = {}
+    seen = set()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        def submit(word):
+            seen.add(word)
+            future = executor.submit(warm_word, word, cache, throttle)
+            future.word = word
+            return future
+
+        pending = {submit(word) for word in words if word not in seen}
+
+        try:
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    try:
+                        status, lemma = future.result()
+                    except Exception as error:
+                        status, lemma = "failed", None
+                        report(future.word, "failed ({})".format(error))
+                    else:
+                        report(future.word, status)
+
+                    counts[status] = counts.get(status, 0) + 1
+
+                    if lemma and lemma not in seen:
+                        pending.add(submit(lemma))
+        except BaseException:
+            # do not wait for the queued words when interrupted
+            for future in pending:
+                future.cancel()
+            raise
+
+    return counts
@@ -1,50 +1,196 @@
 # -*- coding: utf-8 -*-
 
 import re
+import time
+import functools
 import attr
 import requests
 from .isplit import isplit
+from .metrics import REGISTRY
+
+REQUESTS = REGISTRY.counter(
+    "ankide_wiktionary_requests_total", "Wiktionary page requests by outcome.", ["outcome"])
+REQUEST_SECONDS = REGISTRY.histogram(
+    "ankide_wiktionary_request_seconds", "Time spent fetching Wiktionary pages.")
+REQUEST_BYTES = REGISTRY.counter(
+    "ankide_wiktionary_bytes_total", "Bytes of Wiktionary markup downloaded.")
+ACCESSOR_CALLS = REGISTRY.counter(
+    "ankide_parser_accessor_calls_total", "Parser accessor calls by memoization result.", ["accessor", "result"])
+ACCESSOR_SECONDS = REGISTRY.histogram(
+    "ankide_parser_accessor_seconds", "Time spent in parser accessors.", ["accessor"])
+
+
+# a page costing more than this to clean is given up on instead of stalling a worker
+MAX_PAGE_SIZE = 4 * 1024 * 1024
+CLEAN_BUDGET = 2.0
+
+BOLD_PATTERN = re.compile(r"'''(.+?)'''")
+ITALICS_PATTERN = re.compile(r"''(.+?)''")
+LINK_PATTERN = re.compile(r"\[\[([\w\s]+)\]\]")
+FOOTNOTE_PATTERN = re.compile(r"<sup>\[\d+\]</sup>")
+SPACES_PATTERN = re.compile(r"\s\s+")
+
 
 class WordNotFoundError(Exception):
     pass
 
 
+class PageBudgetExceededError(Exception):
+    pass
+
+
+def _remove_spans(line, start, end):
+    """Like re.sub(start + ".+?" + end, "", line) on a single line, but in linear time."""
+    pieces = []
+    position = 0
+
+    while True:
+        opening = line.find(start, position)
+        if opening == -1:
+            break
+
+        closing = line.find(end, opening + len(start) + 1)
+        if closing == -1:
+            # no later opening can be closed either
+            break
+
+        pieces.append(line[position:opening])
+        position = closing + len(end)
+
+    pieces.append(line[position:])
+    return "".join(pieces)
+
+
+def _unlink_piped(line):
+    r"""Like re.sub(r"\[\[[^|]+\|([^\]]+)\]\]", r"\1", line), but in linear time.
+
+    A link's target runs up to the first "|" and its label up to the first
+    "]" after that, so both are shared by every "[[" in front of them and
+    only looked up again once the scan has passed them.
+    """
+    pieces = []
+    position = 0
+    pipe = close = -1
+
+    opening = line.find("[[")
+    while opening != -1:
+        if pipe < opening + 2:
+            pipe = line.find("|", opening + 2)
+            if pipe == -1:
+                break
+
+        if close < pipe:
+            close = line.find("]", pipe + 1)
+            if close == -1:
+                close = len(line)
+
+        if pipe > opening + 2 and close > pipe + 1 and line.startswith("]]", close):
+            pieces.append(line[position:opening])
+            pieces.append(line[pipe + 1:close])
+            position = close + 2
+            opening = line.find("[[", position)
+        else:
+            opening = line.find("[[", opening + 1)
+
+    pieces.append(line[position:])
+    return "".join(pieces)
+
+
+def _instrumented(key):
+    """Count memoization hits/misses and time an accessor storing its result under key."""
+    def decorator(accessor):
+        name = accessor.__name__
+
+        @functools.wraps(accessor)
+        def wrapper(self):
+            ACCESSOR_CALLS.inc(name, "hit" if key in self._word_data else "miss")
+            with ACCESSOR_SECONDS.time(name):
+                try:
+                    return accessor(self)
+                except KeyError:
+                    # the accessors' finally clause hides the error that left their result unset
+                    if self._budget_error is not None:
+                        raise self._budget_error
+                    raise
+
+        return wrapper
+
+    return decorator
+
+
 @attr.s
 class WiktionaryParser:
     _markup = attr.ib(validator=attr.validators.instance_of(str))
-    _word_data = attr.ib(init=False, default=attr.Factory(dict))
+    _word_data = attr.ib(default=attr.Factory(dict))
     _block_sequence_num = attr.ib(init=False)
     _markup_by_line = attr.ib(init=False, default=None)
+    _max_page_size = attr.ib(default=MAX_PAGE_SIZE)
+    _clean_budget = attr.ib(default=CLEAN_BUDGET)
+    _clean_seconds = attr.ib(init=False, default=0.0)
+    _cleaned_lines = attr.ib(init=False, default=attr.Factory(list))
+    _raw_lines = attr.ib(init=False, default=None)
+    _budget_error = attr.ib(init=False, default=None)
 
     def _clean_line(self, line):
         line = line.strip()
         # remove bold tags:
-        line = re.sub(r"'''(.+?)'''", r"\1", line)
+        line = BOLD_PATTERN.sub(r"\1", line)
         # remove italics:
-        line = re.sub(r"''(.+?)''", r"\1", line)
+        line = ITALICS_PATTERN.sub(r"\1", line)
         # remove links:
-        line = re.sub(r"\[\[([\w\s]+)\]\]", r"\1", line)
+        line = LINK_PATTERN.sub(r"\1", line)
         # more links:
-        line = re.sub(r"\[\[[^|]+\|([^\]]+)\]\]", r"\1", line)
+        line = _unlink_piped(line)
         # footnotes:
-        line = re.sub(r"<sup>\[\d+\]</sup>", "", line)
+        line = FOOTNOTE_PATTERN.sub("", line)
         # references:
-        line = re.sub(r"<ref.+?</ref>", "", line)
+        line = _remove_spans(line, "<ref", "</ref>")
         # more references:
-        line = re.sub(r"<ref.+?/>", "", line)
+        line = _remove_spans(line, "<ref", "/>")
         # cleanup multiple spaces:
-        line = re.sub(r"\s\s+", " ", line)
+        line = SPACES_PATTERN.sub(" ", line)
         return line
 
+    def _lines(self):
+        """Cleaned non-empty lines; each line is cleaned once and only when first needed."""
+        if self._raw_lines is None:
+            if len(self._markup) > self._max_page_size:
+                self._budget_error = PageBudgetExceededError(
+                    "Page is larger than {} characters".format(self._max_page_size))
+                raise self._budget_error
+            self._raw_lines = isplit(self._markup, "\n")
+
+        index = 0
+
+        while True:
+            while index < len(self._cleaned_lines):
+                yield self._cleaned_lines[index]
+                index += 1
+
+            for line in self._raw_lines:
+                if line.strip():
+                    break
+            else:
+                return
+
+            start = time.perf_counter()
+            self._cleaned_lines.append(self._clean_line(line))
+            self._clean_seconds += time.perf_counter() - start
+
+            if self._clean_seconds > self._clean_budget:
+                self._budget_error = PageBudgetExceededError(
+                    "Cleaning took longer than {} seconds".format(self._clean_budget))
+                raise self._budget_error
+
     def _ready_markup_generator(self):
-        self._markup_by_line = (self._clean_line(line) for line in
-                                isplit(self._markup, "\n") if line.strip())
+        self._markup_by_line = self._lines()
 
     def _get_matches(self, pattern):
         self._ready_markup_generator()
+        pattern = re.compile(pattern)
 
         for line in self._markup_by_line:
-            match = re.match(pattern, line)
+            match = pattern.match(line)
 
             try:
                 return match.group(1) if len(match.groups()) == 1 else match.groups()
@@ -53,40 +199,50 @@ class WiktionaryParser:
 
     def _get_matches_for_block(self, label, block_start_pattern, line_pattern):
         self._ready_markup_generator()
+        block_start_pattern = re.compile(block_start_pattern)
+        line_pattern = re.compile(line_pattern)
 
-        self._word_data[label] = {}
+        # stored only once the whole block is read, so a scan cut short leaves no partial result
+        matches = {}
 
         for line in self._markup_by_line:
-            if re.match(block_start_pattern, line):
+            if block_start_pattern.match(line):
 
                 for block_line in self._markup_by_line:
                     if block_line.startswith("{{"):
+                        self._word_data[label] = matches
                         return
 
-                    match = re.match(line_pattern, block_line)
+                    match = line_pattern.match(block_line)
 
                     try:
-                        self._word_data[label][match.group(1)] = match.group(2)
+                        matches[match.group(1)] = match.group(2)
                     except AttributeError:
                         continue
 
+        self._word_data[label] = matches
+
     def _get_numbered_matches_for_block(self, label, block_start_pattern, line_pattern, notes_pattern=None):
         self._ready_markup_generator()
+        block_start_pattern = re.compile(block_start_pattern)
+        line_pattern = re.compile(line_pattern)
 
-        self._word_data[label] = {}
+        # stored only once the whole block is read, so a scan cut short leaves no partial result
+        matches = {}
 
         number = 0
 
         for line in self._markup_by_line:
-            if re.match(block_start_pattern, line):
+            if block_start_pattern.match(line):
 
                 for block_line in self._markup_by_line:
                     if block_line.startswith("{{"):
+                        self._word_data[label] = matches
                         return
 
                     number += 1
 
-                    line_match = re.match(line_pattern, block_line)
+                    line_match = line_pattern.match(block_line)
                     if line_match:
                         if notes_pattern is not None:
                             notes_match = re.match(notes_pattern, line_match.group(1))
@@ -95,14 +251,17 @@ class WiktionaryParser:
                                 notes, text = notes_match.groups()
                                 notes = notes.replace("|", ", ")
 
-                                self._word_data[label][number] = (notes, text)
+                                matches[number] = (notes, text)
 
                             else:
-                                self._word_data[label][number] = (None, line_match.group(1))
+                                matches[number] = (None, line_match.group(1))
 
                         else:
-                            self._word_data[label][number] = line_match.group(1)
+                            matches[number] = line_match.group(1)
 
+        self._word_data[label] = matches
+
+    @_instrumented("type")
     def word_type(self):
         try:
             self._word_data["type"]
@@ -111,6 +270,7 @@ class WiktionaryParser:
         finally:
             return self._word_data["type"]
 
+    @_instrumented("type")
     def is_conjugated(self):
         try:
             self._word_data["type"]
@@ -119,6 +279,7 @@ class WiktionaryParser:
         finally:
             return self._word_data["type"] == "Konjugierte Form"
 
+    @_instrumented("type")
     def is_a_declension(self):
         try:
             self._word_data["type"]
@@ -127,6 +288,7 @@ class WiktionaryParser:
         finally:
             return self._word_data["type"] == "Deklinierte Form"
 
+    @_instrumented("type")
     def is_partizip_ii(self):
         try:
             self._word_data["type"]
@@ -135,6 +297,7 @@ class WiktionaryParser:
         finally:
             return self._word_data["type"] == "Partizip II"
 
+    @_instrumented("basic form")
     def basic_form(self):
         try:
             self._word_data["basic form"]
@@ -143,6 +306,7 @@ class WiktionaryParser:
         finally:
             return self._word_data["basic form"]
 
+    @_instrumented("alternative")
     def alternative_word(self):
         try:
             self._word_data["alternative"]
@@ -151,6 +315,7 @@ class WiktionaryParser:
         finally:
             return self._word_data["alternative"]
 
+    @_instrumented("overview")
     def overview(self):
         try:
             self._word_data["overview"]
@@ -163,6 +328,7 @@ class WiktionaryParser:
         finally:
             return self._word_data["overview"]
 
+    @_instrumented("audio")
     def audio(self):
         try:
             self._word_data["audio"]
@@ -171,6 +337,7 @@ class WiktionaryParser:
         finally:
             return self._word_data["audio"]
 
+    @_instrumented("meanings")
     def meanings(self):
         try:
             self._word_data["meanings"]
@@ -184,30 +351,33 @@ class WiktionaryParser:
         finally:
             return self._word_data["meanings"]
 
+    @_instrumented("examples")
     def examples(self):
         try:
             self._word_data["examples"]
         except KeyError:
             self._get_numbered_matches_for_block(
                 label="examples",
-                block_start_pattern="^\{\{Beispiele\}\}$",
+                block_start_pattern=r"^\{\{Beispiele\}\}$",
                 line_pattern=r"^:\[[\d\w\s,]+\]\s(.*)$"
             )
         finally:
             return self._word_data["examples"]
 
+    @_instrumented("synonyms")
     def synonyms(self):
         try:
             self._word_data["synonyms"]
         except KeyError:
             self._get_numbered_matches_for_block(
                 label="synonyms",
-                block_start_pattern="^\{\{Synonyme\}\}$",
+                block_start_pattern=r"^\{\{Synonyme\}\}$",
                 line_pattern=r"^:\[[\s\d,\]]+(.*)$"
             )
         finally:
             return self._word_data["synonyms"]
 
+    @_instrumented("translation")
     def translation(self):
         try:
             self._word_data["translation"]
@@ -223,11 +393,57 @@ class WiktionaryParser:
     def word_data(self):
         return self._word_data
 
+    def parse_all(self):
+        for accessor in (self.word_type, self.basic_form, self.alternative_word, self.overview, self.audio,
+                         self.meanings, self.examples, self.synonyms, self.translation):
+            accessor()
+
+        return self._word_data
+
+
+def fetch_markup(word):
+    with REQUEST_SECONDS.time():
+        try:
+            request = requests.get(r"https://de.wiktionary.org/w/index.php?title={}&action=raw".format(word))
+        except requests.RequestException:
+            REQUESTS.inc("error")
+            raise
+
+    REQUEST_BYTES.inc(amount=len(request.content))
+
+    if request.status_code == 404 or (request.ok and not request.text):
+        REQUESTS.inc("not_found")
+        raise WordNotFoundError(word)
+
+    try:
+        # anything else but a page, like rate limiting, must not end up in the cache
+        request.raise_for_status()
+    except requests.HTTPError:
+        REQUESTS.inc("error")
+        raise
+
+    REQUESTS.inc("found")
+
+    return request.text
+
+
+def parse_word(word, cache=None):
+    if cache is None:
+        return WiktionaryParser(fetch_markup(word))
+
+    try:
+        markup, word_data = cache.get(word)
+    except KeyError:
+        try:
+            markup = fetch_markup(word)
+        except WordNotFoundError:
+            cache.put(word, None)
+            raise
 
-def parse_word(word):
-    request = requests.get(r"https://de.wiktionary.org/w/index.php?title={}&action=raw".format(word))
+        word_data = {}
+        cache.put(word, markup)
 
-    if not request.text:
+    if markup is None:
         raise WordNotFoundError(word)
 
-    return WiktionaryParser(request.text)
\ No newline at end of file
+    return WiktionaryParser(markup, word_data)
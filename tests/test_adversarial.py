@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Fuzzing and worst-case throughput of the markup cleaning.
+
+Run directly to print the throughput on every adversarial input.
+"""
+
+import re
+import time
+import random
+import pytest
+
+from ankide.wiktionary_parser import WiktionaryParser, PageBudgetExceededError
+
+# the regular expressions _clean_line used before the hand-written scanners
+REFERENCE_PATTERNS = [
+    (r"'''(.+?)'''", r"\1"),
+    (r"''(.+?)''", r"\1"),
+    (r"\[\[([\w\s]+)\]\]", r"\1"),
+    (r"\[\[[^|]+\|([^\]]+)\]\]", r"\1"),
+    (r"<sup>\[\d+\]</sup>", ""),
+    (r"<ref.+?</ref>", ""),
+    (r"<ref.+?/>", ""),
+    (r"\s\s+", " "),
+]
+
+TOKENS = ["[[", "]]", "[", "]", "|", "<ref", "</ref>", "/>", ">", "<", "/", "'''", "''", "'",
+          "<sup>[1]</sup>", " ", "  ", "\t", "Haus", "ä", "_", "1", "name=x"]
+
+# (name, repeated unit) for lines that made the old patterns backtrack quadratically
+ADVERSARIAL = [
+    ("unclosed refs", "<ref x"),
+    ("unclosed self-closing refs", "<ref x/"),
+    ("links without label end", "[[a|b"),
+    ("links without pipe", "[[a]"),
+    ("nested link openers", "[[[[|"),
+    ("unpaired bold", "'''a''"),
+    ("whitespace runs", " \t"),
+]
+
+LINE_LENGTH = 200000
+# quadrupling a line may cost at most this factor plus some slack for timer noise;
+# a quadratic cleaner needs about 16 times as long
+GROWTH_LIMIT = 8
+GROWTH_SLACK = 0.01
+
+
+def reference_clean_line(line):
+    line = line.strip()
+    for pattern, replacement in REFERENCE_PATTERNS:
+        line = re.sub(pattern, replacement, line)
+    return line
+
+
+def clean_line(line):
+    return WiktionaryParser("")._clean_line(line)
+
+
+def test_fuzz_matches_reference():
+    randomizer = random.Random(2024)
+
+    for _ in range(20000):
+        line = "".join(randomizer.choice(TOKENS) for _ in range(randomizer.randint(0, 30)))
+        assert clean_line(line) == reference_clean_line(line), line
+
+
+@pytest.mark.parametrize("line", [
+    "'''Haus''' ist ein [[Gebäude]]",
+    "[[Gebäude|Gebäudes]] und [[Wohnung|Wohnungen]]",
+    "[[a[[b|c]]d|e]]",
+    "Haus<ref>{{Ref-Duden|Haus}}</ref> und <ref name=\"x\"/>mehr",
+    "<ref name=a/>[[x|y]]<ref>z</ref>",
+    ":[1] Gebäude<sup>[1]</sup>   ",
+])
+def test_known_lines_match_reference(line):
+    assert clean_line(line) == reference_clean_line(line)
+
+
+def best_time(line, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        clean_line(line)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+@pytest.mark.parametrize("name, unit", ADVERSARIAL, ids=[name for name, unit in ADVERSARIAL])
+def test_adversarial_growth_is_linear(name, unit):
+    line = unit * (LINE_LENGTH // 4 // len(unit))
+
+    short = best_time(line)
+    long = best_time(line * 4)
+
+    assert long < GROWTH_LIMIT * short + GROWTH_SLACK, "{}: {:.4f}s for N, {:.4f}s for 4N".format(name, short, long)
+
+
+def test_page_size_budget():
+    wiktionary = WiktionaryParser("=== {{Wortart|Substantiv|Deutsch}} ===\n" * 10, max_page_size=100)
+
+    with pytest.raises(PageBudgetExceededError):
+        wiktionary.word_type()
+
+
+def test_clean_time_budget():
+    wiktionary = WiktionaryParser("<ref x\n" * 1000 + "=== {{Wortart|Substantiv|Deutsch}} ===", clean_budget=0)
+
+    with pytest.raises(PageBudgetExceededError):
+        wiktionary.word_type()
+
+
+@pytest.mark.parametrize("accessor", ["overview", "translation", "meanings", "parse_all"])
+def test_clean_time_budget_in_blocks(accessor):
+    markup = "=== {{Wortart|Substantiv|Deutsch}} ===\n{{Deutsch Substantiv Übersicht\n" + "|Genus=n\n" * 1000
+    wiktionary = WiktionaryParser(markup)
+    assert wiktionary.word_type() == "Substantiv"
+    wiktionary._clean_budget = 0
+
+    with pytest.raises(PageBudgetExceededError):
+        getattr(wiktionary, accessor)()
+
+    assert "overview" not in wiktionary.word_data()
+
+
+def test_lines_are_cleaned_once():
+    wiktionary = WiktionaryParser("=== {{Wortart|Substantiv|Deutsch}} ===\n{{Grundformverweis Dekl|Haus}}\n")
+    cleaned = []
+    clean_line = wiktionary._clean_line
+
+    def counting_clean_line(line):
+        cleaned.append(line)
+        return clean_line(line)
+
+    wiktionary._clean_line = counting_clean_line
+
+    assert wiktionary.word_type() == "Substantiv"
+    assert wiktionary.basic_form() == "Haus"
+    assert wiktionary.audio() is None
+    assert len(cleaned) == 2
+
+
+if __name__ == "__main__":
+    for name, unit in ADVERSARIAL:
+        line = unit * (LINE_LENGTH // len(unit))
+        start = time.perf_counter()
+        clean_line(line)
+        elapsed = time.perf_counter() - start
+        print("{:<30} {:>8} characters {:>12.0f} characters/s".format(name, len(line), len(line) / elapsed))
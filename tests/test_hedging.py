@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import time
+import concurrent.futures
+import pytest
+
+from ankide.hedging import hedged_call, LatencyRecorder
+
+
+@pytest.fixture
+def executor():
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        yield executor
+
+
+def test_hedged_call_without_delay(executor):
+    assert hedged_call(executor, str.upper, "haus") == "HAUS"
+
+
+def test_hedged_call_hedges_straggler(executor):
+    delays = [1.0, 0.0]
+
+    def slow_then_fast(word):
+        time.sleep(delays.pop(0))
+        return word
+
+    start = time.perf_counter()
+    assert hedged_call(executor, slow_then_fast, "Haus", delay=0.05) == "Haus"
+    assert time.perf_counter() - start < 0.5
+
+
+def test_hedged_call_ignores_retryable_failure(executor):
+    calls = []
+
+    def fail_then_succeed(word):
+        calls.append(word)
+        if len(calls) == 1:
+            time.sleep(0.1)
+            raise ConnectionError(word)
+        time.sleep(0.2)
+        return word
+
+    assert hedged_call(executor, fail_then_succeed, "Haus", delay=0.05, retry_on=(ConnectionError,)) == "Haus"
+
+
+def test_hedged_call_raises_when_both_fail(executor):
+    def always_fail(word):
+        time.sleep(0.1)
+        raise ConnectionError(word)
+
+    with pytest.raises(ConnectionError):
+        hedged_call(executor, always_fail, "Haus", delay=0.01, retry_on=(ConnectionError,))
+
+
+def test_latency_recorder_percentiles():
+    timings = LatencyRecorder()
+    assert timings.percentile(50) is None
+
+    for milliseconds in range(1, 101):
+        timings.record(milliseconds / 1000)
+
+    assert timings.percentile(50) == 0.05
+    assert timings.percentile(99) == 0.099
+    assert timings.report() == "n=100 p50=50ms p90=90ms p99=99ms max=100ms"
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import json
+import pytest
+
+from ankide.journal import Journal, JournalError
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return tmp_path / "words.csv.journal", tmp_path / "words.csv"
+
+
+def test_journal_records_states(paths):
+    journal_path, output = paths
+
+    with Journal(journal_path, output, group_size=2) as journal:
+        journal.record("Haus", "fetched")
+        journal.record("Haus", "translated")
+        journal.write_row("Haus", ["Haus", "house", None])
+        journal.record("Xyz", "failed", reason="timeout")
+
+    entries = [json.loads(line) for line in journal_path.read_text(encoding="utf-8").splitlines()]
+    assert entries[0] == {"state": "start", "size": 0}
+    assert entries[-1] == {"word": "Xyz", "state": "failed", "reason": "timeout"}
+    assert output.read_bytes() == b"Haus\thouse\t\r\n"
+
+    with Journal(journal_path, output) as journal:
+        assert journal.state("Haus") == "written"
+        assert journal.state("Xyz") == "failed"
+        assert journal.failures("Xyz") == [{"word": "Xyz", "state": "failed", "reason": "timeout"}]
+        assert journal.state("Hund") is None
+
+
+def test_journal_keeps_rows_appended_between_runs(paths):
+    journal_path, output = paths
+    output.write_bytes(b"Alt\told\r\n")
+
+    with Journal(journal_path, output) as journal:
+        journal.write_row("Haus", ["Haus", "house"])
+
+    # an interactive lookup adds a row to the same file
+    with output.open("ab") as file:
+        file.write(b"Hund\tdog\r\n")
+
+    with Journal(journal_path, output) as journal:
+        journal.write_row("Katze", ["Katze", "cat"])
+
+    assert output.read_bytes() == b"Alt\told\r\nHaus\thouse\r\nHund\tdog\r\nKatze\tcat\r\n"
+
+
+def interrupt_write(journal_path, output, word, row, written):
+    """Leave the journal and output as a crash while writing row would."""
+    offset = output.stat().st_size
+    entry = {"word": word, "state": "writing", "offset": offset, "row": row}
+    with journal_path.open("a", encoding="utf-8") as file:
+        file.write(json.dumps(entry) + "\n" + '{"word": "' + word + '", "sta')
+    with output.open("ab") as file:
+        file.write(written)
+
+
+def test_journal_cuts_off_torn_row(paths):
+    journal_path, output = paths
+
+    with Journal(journal_path, output) as journal:
+        journal.write_row("Haus", ["Haus", "house"])
+
+    interrupt_write(journal_path, output, "Hund", "Hund\tdog\r\n", b"Hund\td")
+
+    with Journal(journal_path, output) as journal:
+        assert journal.state("Hund") == "failed"
+        assert journal.failures("Hund")[-1]["reason"] == "cut off"
+        journal.write_row("Hund", ["Hund", "dog"])
+
+    assert output.read_bytes() == b"Haus\thouse\r\nHund\tdog\r\n"
+    for line in journal_path.read_text(encoding="utf-8").splitlines():
+        json.loads(line)
+
+    with Journal(journal_path, output) as journal:
+        assert journal.state("Hund") == "written"
+        journal.write_row("Katze", ["Katze", "cat"])
+
+    assert output.read_bytes() == b"Haus\thouse\r\nHund\tdog\r\nKatze\tcat\r\n"
+
+
+def test_journal_forgets_torn_row_once_cut_off(paths):
+    journal_path, output = paths
+
+    with Journal(journal_path, output) as journal:
+        journal.write_row("Haus", ["Haus", "house"])
+
+    interrupt_write(journal_path, output, "Hund", "Hund\tdog\r\n", b"Hund\td")
+
+    # a run that writes no rows, then an interactive lookup adds one
+    with Journal(journal_path, output):
+        pass
+    with output.open("ab") as file:
+        file.write(b"Maus\tmouse\r\n")
+
+    with Journal(journal_path, output) as journal:
+        journal.write_row("Katze", ["Katze", "cat"])
+
+    assert output.read_bytes() == b"Haus\thouse\r\nMaus\tmouse\r\nKatze\tcat\r\n"
+
+
+def test_journal_completes_interrupted_row(paths):
+    journal_path, output = paths
+
+    with Journal(journal_path, output) as journal:
+        journal.write_row("Haus", ["Haus", "house"])
+
+    interrupt_write(journal_path, output, "Hund", "Hund\tdog\r\n", b"Hund\tdog\r\n")
+
+    with Journal(journal_path, output) as journal:
+        assert journal.state("Hund") == "written"
+
+    assert output.read_bytes() == b"Haus\thouse\r\nHund\tdog\r\n"
+
+
+def test_journal_refuses_unexpected_output(paths):
+    journal_path, output = paths
+
+    with Journal(journal_path, output) as journal:
+        journal.write_row("Haus", ["Haus", "house"])
+
+    interrupt_write(journal_path, output, "Hund", "Hund\tdog\r\n", b"Hu")
+    with output.open("ab") as file:
+        file.write(b"Katze\tcat\r\n")
+
+    with pytest.raises(JournalError):
+        Journal(journal_path, output).open()
+
+    output.write_bytes(b"")
+
+    with pytest.raises(JournalError):
+        Journal(journal_path, output).open()
+
+
+def test_journal_never_runs_ahead_of_output(paths, tmp_path):
+    journal_path, output = paths
+    words = ["Wort{}".format(number) for number in range(300)]
+
+    journal = Journal(journal_path, output, group_size=10 ** 6)
+    journal.open()
+    for word in words:
+        # short rows so the journal's buffer fills up first
+        journal.write_row(word, [word])
+
+    # a crash leaves only what has reached the operating system
+    crashed_journal, crashed_output = tmp_path / "crashed.journal", tmp_path / "crashed.csv"
+    crashed_journal.write_bytes(journal_path.read_bytes())
+    crashed_output.write_bytes(output.read_bytes())
+    journal.close()
+
+    with Journal(crashed_journal, crashed_output) as recovered:
+        written = [word for word in words if recovered.state(word) == "written"]
+
+    assert written == words[:len(written)]
+    assert crashed_output.read_bytes() == b"".join(
+        "{}\r\n".format(word).encode("utf-8") for word in written)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import pytest
+
+from ankide import __main__ as ankide_main
+from ankide.hedging import LatencyRecorder
+from ankide.wiktionary_parser import WiktionaryParser
+
+GEHEN = """== gehen ({{Sprache|Deutsch}}) ==
+=== {{Wortart|Verb|Deutsch}} ===
+{{Deutsch Verb Übersicht
+|Präsens_ich=gehe
+|Präsens_du=gehst
+|Präteritum_ich=ging
+|Partizip II=gegangen
+|Imperativ Singular=geh
+|Hilfsverb=sein
+}}
+"""
+
+
+@pytest.fixture
+def translated(monkeypatch):
+    translated = []
+
+    def _bing_translator(word):
+        translated.append(word)
+        return "to go"
+
+    monkeypatch.setattr(ankide_main, "_bing_translator", _bing_translator)
+    monkeypatch.setattr(ankide_main, "parse_word", lambda word, cache=None: WiktionaryParser(GEHEN))
+    return translated
+
+
+def test_parallel_verb_uses_speculative_translation(translated):
+    options = {"parallel": True, "hedge": None, "cache": None}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        found, data = ankide_main.timed_lookup("gehen", options, executor, LatencyRecorder())
+
+    assert found
+    assert data[:3] == ["gehen", "to go", "gehe"]
+    assert translated == ["gehen"]
+
+
+def test_serial_verb_translates_first_person(translated):
+    options = {"parallel": False, "hedge": None, "cache": None}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        found, data = ankide_main.timed_lookup("gehen", options, executor, LatencyRecorder())
+
+    assert data[1] == "to go"
+    assert translated == ["gehe"]
+
+
+def test_translation_metrics_separate_speculative_requests(translated):
+    options = {"parallel": True, "hedge": None, "cache": None}
+    bing = ankide_main.TRANSLATION_SECONDS.count("bing")
+    speculative = ankide_main.TRANSLATION_SECONDS.count("speculative")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        ankide_main.timed_lookup("gehen", options, executor, LatencyRecorder())
+
+    assert ankide_main.TRANSLATION_SECONDS.count("bing") == bing
+    assert ankide_main.TRANSLATION_SECONDS.count("speculative") == speculative + 1
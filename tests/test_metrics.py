@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import urllib.request
+
+from ankide.metrics import Registry
+
+
+def test_counter_exposition():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests by outcome.", ["outcome"])
+    requests.inc("found")
+    requests.inc("found")
+    requests.inc("not_found", amount=3)
+
+    assert registry.exposition() == (
+        "# HELP requests_total Requests by outcome.\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{outcome="found"} 2\n'
+        'requests_total{outcome="not_found"} 3\n'
+    )
+
+
+def test_histogram_exposition():
+    registry = Registry()
+    seconds = registry.histogram("seconds", "Latency.", buckets=(0.1, 1.0))
+    seconds.observe(0.05)
+    seconds.observe(0.5)
+    seconds.observe(5)
+
+    assert registry.exposition().splitlines()[2:] == [
+        'seconds_bucket{le="0.1"} 1',
+        'seconds_bucket{le="1"} 2',
+        'seconds_bucket{le="+Inf"} 3',
+        "seconds_sum 5.55",
+        "seconds_count 3",
+    ]
+
+
+def test_load_accumulates_previous_run():
+    registry = Registry()
+    registry.counter("words_total", "Words.", ["word_type"]).inc('Sub"stantiv')
+    registry.histogram("seconds", "Latency.", buckets=(0.1, 1.0)).observe(0.5)
+    text = registry.exposition()
+
+    restored = Registry()
+    words = restored.counter("words_total", "Words.", ["word_type"])
+    seconds = restored.histogram("seconds", "Latency.", buckets=(0.1, 1.0))
+    restored.load(text)
+
+    words.inc('Sub"stantiv')
+    seconds.observe(0.05)
+
+    assert words.value('Sub"stantiv') == 2
+    assert seconds.count() == 2
+    assert 'seconds_bucket{le="0.1"} 1' in restored.exposition()
+    assert 'seconds_bucket{le="1"} 2' in restored.exposition()
+
+
+def test_textfile_round_trip(tmp_path):
+    registry = Registry()
+    registry.counter("rows_total", "Rows.").inc()
+    path = tmp_path / "ankide.prom"
+
+    registry.read_textfile(path)
+    registry.write_textfile(path)
+
+    restored = Registry()
+    rows = restored.counter("rows_total", "Rows.")
+    restored.read_textfile(path)
+    assert rows.value() == 1
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_processes_add_to_textfile(tmp_path):
+    path = tmp_path / "ankide.prom"
+
+    for rows_written in (2, 3):
+        registry = Registry()
+        registry.counter("rows_total", "Rows.").inc(amount=rows_written)
+        registry.histogram("write_seconds", "Writes.", buckets=(1.0,)).observe(0.5)
+        registry.add_to_textfile(path)
+
+    restored = Registry()
+    rows = restored.counter("rows_total", "Rows.")
+    writes = restored.histogram("write_seconds", "Writes.", buckets=(1.0,))
+    restored.read_textfile(path)
+    assert rows.value() == 5
+    assert writes.count() == 2
+    assert "write_seconds_bucket{le=\"1\"} 2" in path.read_text()
+
+
+def test_serve():
+    registry = Registry()
+    registry.counter("rows_total", "Rows.").inc()
+    server = registry.serve(0)
+
+    try:
+        with urllib.request.urlopen("http://127.0.0.1:{}/metrics".format(server.server_port)) as response:
+            assert b"rows_total 1" in response.read()
+    finally:
+        server.shutdown()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+import time
+import pytest
+import pathlib
+import pickle
+import requests
+
+from ankide import warm as warm_module, wiktionary_parser
+from ankide.cache import WordCache
+from ankide.warm import Throttle, read_word_list, warm
+from ankide.wiktionary_parser import WordNotFoundError, parse_word
+
+HAEUSER = """== Häuser ({{Sprache|Deutsch}}) ==
+=== {{Wortart|Deklinierte Form|Deutsch}} ===
+{{Grundformverweis Dekl|Haus}}
+"""
+
+
+@pytest.fixture(scope="module")
+def markup_Haus():
+    file = pathlib.Path(__file__).parent / "Haus.bin"
+    with file.open("rb") as file:
+        return pickle.load(file, encoding="utf-8")
+
+
+@pytest.fixture
+def fetched(monkeypatch, markup_Haus):
+    pages = {"Haus": markup_Haus, "Häuser": HAEUSER}
+    fetched = []
+
+    def fetch_markup(word):
+        fetched.append(word)
+        try:
+            return pages[word]
+        except KeyError:
+            raise WordNotFoundError(word)
+
+    monkeypatch.setattr(warm_module, "fetch_markup", fetch_markup)
+    return fetched
+
+
+def test_word_cache(tmp_path):
+    cache = WordCache(tmp_path)
+    assert "Haus" not in cache
+
+    with pytest.raises(KeyError):
+        cache.get("Haus")
+
+    cache.put("Haus", "markup", {"type": "Substantiv"})
+    cache.put("haus", None)
+
+    assert cache.get("Haus") == ("markup", {"type": "Substantiv"})
+    assert cache.get("haus") == (None, {})
+    assert sorted(path.suffix for path in tmp_path.iterdir()) == [".pickle", ".pickle"]
+
+
+def test_parse_word_from_cache(tmp_path):
+    cache = WordCache(tmp_path)
+    cache.put("Haus", "=== {{Wortart|Substantiv|Deutsch}} ===", {"type": "Substantiv"})
+    cache.put("Xyz", None)
+
+    assert parse_word("Haus", cache).word_type() == "Substantiv"
+
+    with pytest.raises(WordNotFoundError):
+        parse_word("Xyz", cache)
+
+
+@pytest.mark.parametrize("status_code, text, error", [
+    (404, "", WordNotFoundError),
+    (200, "", WordNotFoundError),
+    (429, "Too many requests", requests.HTTPError),
+    (503, "", requests.HTTPError),
+])
+def test_parse_word_caches_only_pages(tmp_path, monkeypatch, status_code, text, error):
+    def get(url):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = text.encode("utf-8")
+        response.encoding = "utf-8"
+        return response
+
+    monkeypatch.setattr(requests, "get", get)
+    cache = WordCache(tmp_path)
+
+    with pytest.raises(error):
+        parse_word("Haus", cache)
+
+    assert ("Haus" in cache) == (error is WordNotFoundError)
+
+
+def test_read_word_list(tmp_path):
+    word_list = tmp_path / "words.txt"
+    word_list.write_text("# word count\nHaus 120\n\nHäuser 80\nHaus 3\n", encoding="utf-8")
+
+    assert read_word_list(word_list) == ["Haus", "Häuser"]
+
+
+def test_warm_resolves_lemmas(tmp_path, fetched):
+    cache = WordCache(tmp_path)
+
+    counts = warm(["Häuser", "Xyz"], cache, jobs=2, throttle=Throttle(10 ** 9))
+
+    assert counts == {"fetched": 2, "not found": 1}
+    assert sorted(fetched) == ["Haus", "Häuser", "Xyz"]
+
+    markup, word_data = cache.get("Haus")
+    assert word_data["type"] == "Substantiv"
+    assert word_data["translation"] == {"en": "house"}
+
+
+def test_warm_is_resumable(tmp_path, fetched):
+    cache = WordCache(tmp_path)
+    warm(["Häuser"], cache, jobs=2, throttle=Throttle(10 ** 9))
+    del fetched[:]
+
+    counts = warm(["Häuser", "Xyz"], cache, jobs=2, throttle=Throttle(10 ** 9))
+
+    assert counts == {"cached": 2, "not found": 1}
+    assert fetched == ["Xyz"]
+
+
+def test_word_cache_expiry(tmp_path, monkeypatch):
+    cache = WordCache(tmp_path, ttl=100, not_found_ttl=10)
+    cache.put("Haus", "markup")
+    cache.put("Xyz", None)
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 50)
+
+    assert cache.get("Haus") == ("markup", {})
+    assert "Xyz" not in cache
+    with pytest.raises(KeyError):
+        cache.get("Xyz")
+
+
+def test_word_cache_refresh(tmp_path, monkeypatch, markup_Haus):
+    monkeypatch.setattr(wiktionary_parser, "fetch_markup", lambda word: markup_Haus)
+    cache = WordCache(tmp_path)
+    cache.put("Haus", None)
+
+    with pytest.raises(WordNotFoundError):
+        parse_word("Haus", cache)
+
+    assert parse_word("Haus", WordCache(tmp_path, refresh=True)).word_type() == "Substantiv"
+    assert parse_word("Haus", cache).word_type() == "Substantiv"